@@ -32,7 +32,7 @@ class AnimationReport:
     """
     Data container for temporal synthesis (Video) results.
     """
-    video_b64: str
+    video_bytes: bytes
     inference_time: float
     total_frames: int
     fps: int
@@ -11,24 +11,31 @@
 #
 # author: Enrique González Gutiérrez <enrique.gonzalez.gutierrez@gmail.com>
 
-import io
-import base64
+import time
+import uuid
+import asyncio
+import orjson
+import msgpack
 import redis
 import os
+from typing import Optional
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from celery import states
 from celery.result import AsyncResult
-from PIL import Image
 
 # Infrastructure & Domain Imports
-from src.infrastructure.worker import transform_character_task, animate_character_task, celery_app
+from src.infrastructure.worker import transform_character_task, animate_character_task, celery_app, decode_source_image, result_cache_key
 from src.infrastructure.analyzer import HeuristicImageAnalyzer
 
 app = FastAPI(
     title="Z-Realism Expert Gateway", 
     version="23.0",
-    root_path="/api"
+    root_path="/api",
+    # orjson (C) serializer for every JSON body, status polls included.
+    default_response_class=ORJSONResponse
 )
 
 # --- CORS Configuration ---
@@ -41,13 +48,118 @@ app.add_middleware(
 )
 
 # --- Hardware Mutex ---
-redis_client = redis.from_url(os.getenv("CELERY_BROKER_URL", "redis://z-realism-broker:6379/0"))
+# Bounded socket timeouts: an unreachable broker fails the request quickly
+# instead of stalling a threadpool slot on the OS-level TCP timeout.
+REDIS_CONNECT_TIMEOUT_S = float(os.getenv("REDIS_CONNECT_TIMEOUT_S", "1.0"))
+REDIS_SOCKET_TIMEOUT_S = float(os.getenv("REDIS_SOCKET_TIMEOUT_S", "5.0"))
+redis_client = redis.from_url(
+    os.getenv("CELERY_BROKER_URL", "redis://z-realism-broker:6379/0"),
+    socket_connect_timeout=REDIS_CONNECT_TIMEOUT_S,
+    socket_timeout=REDIS_SOCKET_TIMEOUT_S,
+)
 SYSTEM_LOCK_KEY = "z_realism_v21_mutex"
 LOCK_TIMEOUT = 900
 
+def _acquire_hardware_lock() -> str:
+    """
+    Takes the mutex atomically (SET NX) under a pre-allocated task id, so two
+    API workers can never both pass the check and dispatch.
+    """
+    task_id = str(uuid.uuid4())
+    if not redis_client.set(SYSTEM_LOCK_KEY, task_id, nx=True, ex=LOCK_TIMEOUT):
+        # Update: Using i18n key for hardware busy state
+        raise HTTPException(status_code=429, detail="error_hardware_busy")
+    return task_id
+
 # --- Heuristic Intelligence ---
 image_analyzer = HeuristicImageAnalyzer()
 
+# --- Upload Handles ---
+# /upload and /analyze park the artwork so generation jobs can reference it by
+# id instead of receiving the same multi-MB upload again for every run.
+# Handles are content-addressed: parking the same artwork again only refreshes
+# the TTL of its single entry. Redis is also the Celery broker, so oversized
+# artwork is never parked; the client then sends it inline with the job.
+UPLOAD_NAMESPACE = "upload"
+UPLOAD_KEY_PREFIX = UPLOAD_NAMESPACE + ":"
+UPLOAD_TTL_S = 300
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", 20 * 1024**2))
+
+def _park_upload(content: bytes) -> dict:
+    if len(content) > UPLOAD_MAX_BYTES:
+        return {"upload_id": None, "upload_ttl": 0}
+    upload_key = result_cache_key(content, namespace=UPLOAD_NAMESPACE)
+    # EXPIRE doubles as the existence check, so a repeat never resends the bytes.
+    if not redis_client.expire(upload_key, UPLOAD_TTL_S):
+        redis_client.set(upload_key, content, ex=UPLOAD_TTL_S)
+    return {"upload_id": upload_key[len(UPLOAD_KEY_PREFIX):], "upload_ttl": UPLOAD_TTL_S}
+
+async def _resolve_source(file: Optional[UploadFile], upload_id: str) -> bytes:
+    # Source artwork: a fresh upload, or a copy parked by /upload or /analyze.
+    if file is not None:
+        return await file.read()
+    # Multi-MB GET: blocking I/O stays off the event loop.
+    content = await run_in_threadpool(redis_client.get, UPLOAD_KEY_PREFIX + upload_id) if upload_id else None
+    if content is None:
+        raise HTTPException(status_code=400, detail="error_upload_expired")
+    return content
+
+# The heuristics only use global brightness/alpha statistics, which a small
+# thumbnail preserves; analysing it skips full-resolution decode and conversion.
+ANALYSIS_MAX_SIDE = 512
+
+# Analyses are content-addressed in Redis: the same (artwork, name) pair is
+# answered from cache across tabs, sessions and API workers.
+ANALYSIS_CACHE_TTL_S = 3600
+
+def _analyze_upload(content: bytes, character_name: str) -> dict:
+    cache_key = result_cache_key(content, character_name, namespace="analysis")
+    cached = redis_client.get(cache_key)
+    if cached is not None:
+        return orjson.loads(cached)
+
+    pil_image = decode_source_image(content, ANALYSIS_MAX_SIDE)
+    pil_image.thumbnail((ANALYSIS_MAX_SIDE, ANALYSIS_MAX_SIDE))
+    analysis = image_analyzer.analyze_source(pil_image, character_name)
+    strategy = {
+        "detected_essence": analysis.detected_essence,
+        "recommendations": {
+            "steps": analysis.recommended_steps, 
+            "cfg_scale": analysis.recommended_cfg,
+            "cn_scale_depth": analysis.recommended_cn_depth,
+            "cn_scale_pose": analysis.recommended_cn_pose,
+            "strength": analysis.recommended_strength,
+            "canny_low": analysis.canny_low,
+            "canny_high": analysis.canny_high,
+            "texture_prompt": analysis.suggested_prompt,
+            "negative_prompt": analysis.suggested_negative
+        }
+    }
+    redis_client.set(cache_key, orjson.dumps(strategy), ex=ANALYSIS_CACHE_TTL_S)
+    return strategy
+
+def _publish_cached_result(content: bytes, *params) -> Optional[str]:
+    """
+    Identical resubmission: the worker's content-addressed cache already holds
+    the result, so publish it as a finished task instead of queueing for the GPU.
+    """
+    cached = celery_app.backend.client.get(result_cache_key(content, *params))
+    if cached is None:
+        return None
+    task_id = str(uuid.uuid4())
+    celery_app.backend.store_result(task_id, msgpack.unpackb(cached), states.SUCCESS)
+    return task_id
+
+# --- Asset Registration ---
+@app.post("/upload")
+async def register_upload(file: UploadFile = File(...)):
+    """
+    Parks the source artwork once; later jobs reference it by upload_id.
+    """
+    content = await file.read()
+    # Hashing a multi-MB upload is CPU-bound: keep it off the event loop.
+    return await run_in_threadpool(_park_upload, content)
+
 # --- Analytical Endpoint ---
 @app.post("/analyze")
 async def analyze_visual_dna(
@@ -59,23 +171,16 @@ async def analyze_visual_dna(
     """
     try:
         content = await file.read()
-        pil_image = Image.open(io.BytesIO(content))
-        analysis = image_analyzer.analyze_source(pil_image, character_name)
+        # Hashing, decode + heuristics are CPU-bound: run them off the event loop
+        # so concurrent status polls are not stalled behind the analysis.
+        strategy = await run_in_threadpool(_analyze_upload, content, character_name)
+        # Idempotent: re-analysing the same artwork refreshes its one parked entry.
+        upload = await run_in_threadpool(_park_upload, content)
         
         return {
             "status": "success",
-            "detected_essence": analysis.detected_essence,
-            "recommendations": {
-                "steps": analysis.recommended_steps, 
-                "cfg_scale": analysis.recommended_cfg,
-                "cn_scale_depth": analysis.recommended_cn_depth,
-                "cn_scale_pose": analysis.recommended_cn_pose,
-                "strength": analysis.recommended_strength,
-                "canny_low": analysis.canny_low,
-                "canny_high": analysis.canny_high,
-                "texture_prompt": analysis.suggested_prompt,
-                "negative_prompt": analysis.suggested_negative
-            }
+            **upload,
+            **strategy
         }
     except Exception:
         # Update: Using i18n key for analysis failure
@@ -84,7 +189,8 @@ async def analyze_visual_dna(
 # --- Transformation Endpoint (Static Image) ---
 @app.post("/transform")
 async def transform_image(
-    file: UploadFile = File(...),
+    file: Optional[UploadFile] = File(None),
+    upload_id: str = Form(""),
     character_name: str = Form(...),
     feature_prompt: str = Form(""),
     resolution_anchor: int = Form(512),
@@ -96,36 +202,41 @@ async def transform_image(
     canny_low: int = Form(100),
     canny_high: int = Form(200),
     seed: int = Form(42),
-    negative_prompt: str = Form("anime, cartoon")
+    negative_prompt: str = Form("anime, cartoon"),
+    output_format: str = Form("webp")
 ):
     """
     Dispatches the high-fidelity synthesis job to the CUDA worker.
     """
-    # Update: Using i18n key for hardware busy state
-    if redis_client.exists(SYSTEM_LOCK_KEY):
-        raise HTTPException(status_code=429, detail="error_hardware_busy")
+    content = await _resolve_source(file, upload_id)
 
-    try:
-        content = await file.read()
-        image_b64 = base64.b64encode(content).decode('utf-8')
-
-        hyper_params = {
-            "steps": steps,
-            "cfg_scale": cfg_scale,
-            "cn_depth": cn_depth,
-            "cn_pose": cn_pose,
-            "strength": strength,
-            "canny_low": canny_low,
-            "canny_high": canny_high,
-            "seed": seed,
-            "negative_prompt": negative_prompt
-        }
+    hyper_params = {
+        "steps": steps,
+        "cfg_scale": cfg_scale,
+        "cn_depth": cn_depth,
+        "cn_pose": cn_pose,
+        "strength": strength,
+        "canny_low": canny_low,
+        "canny_high": canny_high,
+        "seed": seed,
+        "negative_prompt": negative_prompt,
+        "output_format": output_format
+    }
 
-        task = transform_character_task.delay(
-            image_b64, character_name, feature_prompt, resolution_anchor, hyper_params
-        )
+    # Hash, lookup and republish are blocking and multi-MB: one threadpool hop.
+    cached_task_id = await run_in_threadpool(
+        _publish_cached_result, content, character_name, feature_prompt, resolution_anchor, hyper_params
+    )
+    if cached_task_id is not None:
+        return {"task_id": cached_task_id, "status": "CACHED"}
+
+    task_id = _acquire_hardware_lock()
 
-        redis_client.set(SYSTEM_LOCK_KEY, task.id, ex=LOCK_TIMEOUT)
+    try:
+        task = transform_character_task.apply_async(
+            (content, character_name, feature_prompt, resolution_anchor, hyper_params),
+            task_id=task_id
+        )
         return {"task_id": task.id, "status": "QUEUED"}
     except Exception as e:
         redis_client.delete(SYSTEM_LOCK_KEY)
@@ -134,58 +245,137 @@ async def transform_image(
 # --- 5. ANIMATION ENDPOINT (VIDEO CLIP) ---
 @app.post("/animate")
 async def animate_image(
-    file: UploadFile = File(...),
+    file: Optional[UploadFile] = File(None),
+    upload_id: str = Form(""),
     character_name: str = Form(...),
     motion_prompt: str = Form("subtle realistic movement, breathing"),
     duration_frames: int = Form(24),
     fps: int = Form(8),
     motion_bucket: int = Form(127),
     denoising_strength: float = Form(0.20),
-    seed: int = Form(42)
+    seed: int = Form(42),
+    vae_decode_device: str = Form("auto")
 ):
     """
     Dispatches a temporal synthesis task (Video).
     """
-    # Update: Using i18n key for hardware busy state
-    if redis_client.exists(SYSTEM_LOCK_KEY):
-        raise HTTPException(status_code=429, detail="error_hardware_busy")
+    task_id = _acquire_hardware_lock()
 
     try:
-        content = await file.read()
-        image_b64 = base64.b64encode(content).decode('utf-8')
-
+        content = await _resolve_source(file, upload_id)
         video_params = {
             "motion_prompt": motion_prompt,
             "duration_frames": duration_frames,
             "fps": fps,
             "motion_bucket": motion_bucket,
             "denoising_strength": denoising_strength,
-            "seed": seed
+            "seed": seed,
+            "vae_decode_device": vae_decode_device
         }
 
-        task = animate_character_task.delay(image_b64, character_name, video_params)
-
-        redis_client.set(SYSTEM_LOCK_KEY, task.id, ex=LOCK_TIMEOUT)
+        task = animate_character_task.apply_async(
+            (content, character_name, video_params), task_id=task_id
+        )
         return {"task_id": task.id, "status": "QUEUED_TEMPORAL"}
+    except HTTPException:
+        redis_client.delete(SYSTEM_LOCK_KEY)
+        raise
     except Exception as e:
         redis_client.delete(SYSTEM_LOCK_KEY)
         raise HTTPException(status_code=500, detail=str(e))
 
+# Raw media served as-is by /result/{task_id}/media: field -> (mime field, default type).
+MEDIA_RESULT_FIELDS = {
+    "result_image_bytes": ("result_image_mime", "image/png"),
+    "video_bytes": (None, "video/mp4"),
+}
+
+def strip_media_for_client(result: dict) -> dict:
+    """
+    Keeps only the lightweight metadata; the media itself travels as binary.
+    """
+    return {key: value for key, value in result.items() if key not in MEDIA_RESULT_FIELDS}
+
 # --- Telemetry & System Control ---
-@app.get("/status/{task_id}")
-async def get_task_status(task_id: str):
-    task_result = AsyncResult(task_id, app=celery_app)
-    if task_result.ready():
+# Status stream cadence: backend reads are server-side and only changes are sent;
+# the heartbeat keeps the proxy from timing out during long model loads.
+STATUS_STREAM_INTERVAL_S = 0.25
+STATUS_STREAM_HEARTBEAT_S = 15.0
+
+def read_task_status(task_id: str) -> dict:
+    """
+    Snapshot of a task's state (plus result metadata on success);
+    releases the hardware mutex once it is finished.
+    """
+    # One backend read per poll: ready()/status/info on an AsyncResult would
+    # each re-fetch and re-decode the task meta while it is in PROGRESS.
+    meta = celery_app.backend.get_task_meta(task_id)
+    status = meta["status"]
+    if status in states.READY_STATES:
         current_lock = redis_client.get(SYSTEM_LOCK_KEY)
         if current_lock and current_lock.decode('utf-8') == task_id:
             redis_client.delete(SYSTEM_LOCK_KEY)
-    return {"status": task_result.status, "progress": task_result.info if task_result.status == 'PROGRESS' else None}
+    snapshot = {"status": status, "progress": meta["result"] if status == 'PROGRESS' else None}
+    if status == states.SUCCESS:
+        # The meta already holds the result: ship its metadata in the same
+        # response instead of making the client call /result afterwards.
+        snapshot["result"] = strip_media_for_client(meta["result"])
+    return snapshot
+
+@app.get("/status/{task_id}")
+async def get_task_status(task_id: str):
+    return read_task_status(task_id)
+
+@app.get("/status/{task_id}/stream")
+async def stream_task_status(task_id: str):
+    """
+    Streams status snapshots as NDJSON over one long-lived response,
+    replacing a client round trip per poll. Ends at the terminal state.
+    """
+    async def status_events():
+        last_snapshot, last_sent = None, 0.0
+        while True:
+            snapshot = await run_in_threadpool(read_task_status, task_id)
+            now = time.monotonic()
+            if snapshot != last_snapshot or now - last_sent >= STATUS_STREAM_HEARTBEAT_S:
+                yield orjson.dumps(snapshot) + b"\n"
+                last_snapshot, last_sent = snapshot, now
+            if snapshot["status"] in states.READY_STATES:
+                return
+            await asyncio.sleep(STATUS_STREAM_INTERVAL_S)
+
+    return StreamingResponse(
+        status_events(),
+        media_type="application/x-ndjson",
+        # Disable nginx response buffering so each line is flushed immediately.
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.get("/result/{task_id}")
 async def get_task_result(task_id: str):
+    return ORJSONResponse(content=strip_media_for_client(_successful_result(task_id)))
+
+def _successful_result(task_id: str) -> dict:
+    """
+    Result payload of a finished task. A failed task's result is the raised
+    exception, never a payload, so it maps to a clean 404.
+    """
     task_result = AsyncResult(task_id, app=celery_app)
     if not task_result.ready(): raise HTTPException(status_code=202, detail="Task is still processing.")
-    return JSONResponse(content=task_result.result)
+    result = task_result.result
+    if task_result.state != states.SUCCESS or not isinstance(result, dict):
+        raise HTTPException(status_code=404, detail="error_inference_failed")
+    return result
+
+@app.get("/result/{task_id}/media")
+async def get_task_media(task_id: str):
+    # Binary body: no base64 inflation and no multi-MB JSON string for the client to parse.
+    result = _successful_result(task_id)
+    for media_key, (mime_key, default_type) in MEDIA_RESULT_FIELDS.items():
+        if media_key in result:
+            media_type = result.get(mime_key, default_type) if mime_key else default_type
+            return Response(content=result[media_key], media_type=media_type)
+    raise HTTPException(status_code=404, detail="error_inference_failed")
 
 @app.post("/system/unlock")
 async def manual_unlock():
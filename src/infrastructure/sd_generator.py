@@ -30,8 +30,13 @@ from diffusers import (
     DPMSolverMultistepScheduler,
     AutoencoderKL
 )
+from diffusers.models.attention_processor import AttnProcessor2_0
 from src.domain.ports import ImageGeneratorPort
 
+# Outputs whose long side exceeds this decode through the tiled VAE. Tiling blends
+# overlapping tiles and alters the image, so the UI's 512-768px anchors stay full-frame.
+VAE_TILING_MIN_SIDE = 768
+
 class StableDiffusionGenerator(ImageGeneratorPort):
     """
     Expert Neural Core for Stylized-to-Photorealistic Transformation.
@@ -44,6 +49,9 @@ class StableDiffusionGenerator(ImageGeneratorPort):
         self._offline = os.getenv("OFFLINE_MODE", "false").lower() == "true"
         self._device = "cuda" if torch.cuda.is_available() and device == "cuda" else "cpu"
         self._torch_dtype = torch.float16 if self._device == "cuda" else torch.float32
+        # Page-locked host buffers, one flat buffer per slot, reused across tasks for DMA uploads.
+        # Each grows to the largest frame seen, so pinned memory never scales with shape variety.
+        self._staging: Dict[str, torch.Tensor] = {}
 
         try:
             print(f"INFRA_AI: Deploying Engine v28.0 [Channels_Last_Optimized] on [{self._device.upper()}]...")
@@ -56,22 +64,31 @@ class StableDiffusionGenerator(ImageGeneratorPort):
                 torch.backends.cudnn.deterministic = False # Relax determinism slightly for speed
 
             # COMPONENT LOADING
+            # Safetensors are memory-mapped and assigned into meta-initialized modules:
+            # no random init and no intermediate pickle copy. The offload hooks place
+            # each component on the GPU when it is first needed.
             vae = AutoencoderKL.from_pretrained(
                 "stabilityai/sd-vae-ft-mse", 
                 torch_dtype=self._torch_dtype, 
-                local_files_only=self._offline
-            ).to(self._device)
+                local_files_only=self._offline,
+                use_safetensors=True,
+                low_cpu_mem_usage=True
+            )
 
             depth_net = ControlNetModel.from_pretrained(
                 "lllyasviel/control_v11f1p_sd15_depth", 
                 torch_dtype=self._torch_dtype, 
-                local_files_only=self._offline
+                local_files_only=self._offline,
+                use_safetensors=True,
+                low_cpu_mem_usage=True
             )
 
             canny_net = ControlNetModel.from_pretrained(
                 "lllyasviel/control_v11p_sd15_canny", 
                 torch_dtype=self._torch_dtype, 
-                local_files_only=self._offline
+                local_files_only=self._offline,
+                use_safetensors=True,
+                low_cpu_mem_usage=True
             )
             
             # PRE-PROCESSORS
@@ -84,8 +101,13 @@ class StableDiffusionGenerator(ImageGeneratorPort):
                 vae=vae, 
                 controlnet=[depth_net, canny_net],
                 torch_dtype=self._torch_dtype, 
+                # No NSFW gate: skip the CLIP checker and the image processor that feeds it.
                 safety_checker=None, 
-                local_files_only=self._offline
+                feature_extractor=None,
+                requires_safety_checker=False,
+                local_files_only=self._offline,
+                use_safetensors=True,
+                low_cpu_mem_usage=True
             )
             
             self._pipe.scheduler = DPMSolverMultistepScheduler.from_config(
@@ -102,6 +124,9 @@ class StableDiffusionGenerator(ImageGeneratorPort):
                     print("INFRA_AI: xFormers Active.")
                 except Exception as e:
                     print(f"INFRA_AI: WARNING - xFormers failed: {e}")
+                    # Rung-down: PyTorch fused SDPA rather than sliced attention.
+                    self._pipe.unet.set_attn_processor(AttnProcessor2_0())
+                    print("INFRA_AI: SDPA attention fallback active.")
 
                 # 2. Channels Last Memory Format (Pure Speed)
                 # Reorganizes tensor memory to match NVIDIA Tensor Core layout.
@@ -118,6 +143,7 @@ class StableDiffusionGenerator(ImageGeneratorPort):
                 print("INFRA_AI: Tensors converted to Channels Last format.")
 
                 # 3. VAE Slicing (Anti-OOM)
+                # Tiling is toggled per call on the output size (see VAE_TILING_MIN_SIDE).
                 self._pipe.enable_vae_slicing()
                 
                 # 4. CPU Offload (VRAM Management)
@@ -129,6 +155,48 @@ class StableDiffusionGenerator(ImageGeneratorPort):
             print(f"INFRA_AI_BOOT_FAILURE: {e}")
             raise e
 
+    def warmup(self, resolution_anchor: int = 512) -> None:
+        """
+        Runs one denoising step on a blank manifold so CuDNN autotuning and the first
+        offload transfers happen at deployment instead of on the first user task.
+        """
+        if self._device != "cuda":
+            return
+
+        print(f"INFRA_AI: Warming up static kernels at {resolution_anchor}px...")
+        blank = Image.new("RGB", (resolution_anchor, resolution_anchor), (127, 127, 127))
+        with torch.inference_mode():
+            self._pipe(
+                prompt="warmup",
+                image=blank,
+                control_image=[blank, blank],
+                strength=1.0,
+                height=resolution_anchor,
+                width=resolution_anchor,
+                num_inference_steps=1,
+                output_type="latent"
+            )
+
+    def _upload_image(self, slot: str, image: Image.Image):
+        """
+        Stages a PIL image through a persistent pinned buffer and copies it to the
+        GPU asynchronously, as a [1, 3, H, W] tensor in [0, 1]. CPU engines keep PIL.
+        """
+        if self._device != "cuda":
+            return image
+
+        pixels = np.asarray(image.convert("RGB"))
+        staging = self._staging.get(slot)
+        if staging is None or staging.numel() < pixels.size:
+            staging = torch.empty(pixels.size, dtype=torch.uint8).pin_memory()
+            self._staging[slot] = staging
+        # Sliced view of the slot buffer, shaped for this frame.
+        staging = staging[:pixels.size].view(pixels.shape)
+        staging.numpy()[...] = pixels
+
+        device_pixels = staging.to(self._device, non_blocking=True)
+        return device_pixels.permute(2, 0, 1).unsqueeze(0).float().div_(255.0)
+
     def generate_live_action(
         self, 
         source_image: Image.Image, 
@@ -180,12 +248,21 @@ class StableDiffusionGenerator(ImageGeneratorPort):
             return callback_kwargs
 
         # --- 5. INFERENCE ---
+        if self._device == "cuda":
+            if max(target_w, target_h) > VAE_TILING_MIN_SIDE:
+                self._pipe.enable_vae_tiling()
+            else:
+                self._pipe.disable_vae_tiling()
+
         with torch.inference_mode():
             output = self._pipe(
                 prompt=final_prompt, 
                 negative_prompt=neg_prompt,
-                image=input_image,
-                control_image=[depth_map, canny_map], 
+                image=self._upload_image("init", input_image),
+                control_image=[
+                    self._upload_image("depth", depth_map),
+                    self._upload_image("canny", canny_map)
+                ], 
                 strength=strength, 
                 height=target_h, 
                 width=target_w,
@@ -15,24 +15,21 @@
 
 import torch
 import numpy as np
-import imageio
-import io
-import base64
+import imageio_ffmpeg
 import time
 import os
+import tempfile
 import warnings
 from typing import Callable, Optional, Tuple, Dict, Any, List
 from PIL import Image
 
-# Essential for memory efficient attention check
-import xformers
-
 from diffusers import (
     AnimateDiffPipeline, 
     MotionAdapter, 
     DDIMScheduler,
     AutoencoderKL
 )
+from diffusers.models.attention_processor import AttnProcessor2_0
 from src.domain.ports import VideoGeneratorPort, AnimationReport
 
 class StableVideoAnimateDiffGenerator(VideoGeneratorPort):
@@ -44,11 +41,17 @@ class StableVideoAnimateDiffGenerator(VideoGeneratorPort):
     """
 
     def __init__(self, device: str = "cpu"):
+        """
+        Deploys the v28.0 Temporal Engine (xFormers, CuDNN Benchmark, Channels Last).
+        """
         warnings.filterwarnings("ignore", category=UserWarning, message=".*Plan failed with a cudnnException.*")
         
         self._offline = os.getenv("OFFLINE_MODE", "false").lower() == "true"
         self._device = "cuda" if torch.cuda.is_available() and device == "cuda" else "cpu"
         self._torch_dtype = torch.float16 if self._device == "cuda" else torch.float32
+        # Half-precision weight variant: avoids downloading fp32 shards only to cast them in RAM.
+        self._variant = "fp16" if self._device == "cuda" else None
+        self._cpu_vae = None  # Lazily loaded fp32 decoder for OOM-safe CPU decoding
 
         try:
             print(f"INFRA_VIDEO: Deploying Temporal Engine v28.0 [Channels_Last_Optimized] on [{self._device.upper()}]...")
@@ -59,16 +62,21 @@ class StableVideoAnimateDiffGenerator(VideoGeneratorPort):
                 # First run might be slightly slower (warmup), subsequent runs are faster.
                 torch.backends.cudnn.benchmark = True
                 torch.backends.cudnn.deterministic = False # Relax determinism slightly for speed
+                # TF32: No-op on Pascal, free matmul/conv throughput on Ampere+ workers.
+                torch.backends.cuda.matmul.allow_tf32 = True
+                torch.backends.cudnn.allow_tf32 = True
 
             # COMPONENT LOADING
-            adapter = MotionAdapter.from_pretrained(
+            adapter = self._load_pretrained(
+                MotionAdapter,
                 "guoyww/animatediff-motion-adapter-v1-5-2", 
                 torch_dtype=self._torch_dtype,
                 local_files_only=self._offline,
                 use_safetensors=True
             )
 
-            vae = AutoencoderKL.from_pretrained(
+            vae = self._load_pretrained(
+                AutoencoderKL,
                 "stabilityai/sd-vae-ft-mse", 
                 torch_dtype=self._torch_dtype, 
                 local_files_only=self._offline,
@@ -76,10 +84,12 @@ class StableVideoAnimateDiffGenerator(VideoGeneratorPort):
             )
 
             # PIPELINE ASSEMBLY
-            self._pipe = AnimateDiffPipeline.from_pretrained(
+            self._pipe = self._load_pretrained(
+                AnimateDiffPipeline,
                 "SG161222/Realistic_Vision_V5.1_noVAE",
                 vae=vae,
                 motion_adapter=adapter,
+                feature_extractor=None, # Only used by IP-Adapter conditioning
                 torch_dtype=self._torch_dtype,
                 local_files_only=self._offline,
                 use_safetensors=True
@@ -92,15 +102,21 @@ class StableVideoAnimateDiffGenerator(VideoGeneratorPort):
                 beta_schedule="linear",
                 steps_offset=1,
             )
+            self._memoize_scheduler_timesteps(default_steps=25)
 
             # --- CRITICAL OPTIMIZATION SUITE v28.0 ---
             if self._device == "cuda":
                 # 1. xFormers (Essential for Temporal Attention)
+                # Imported lazily so CPU-only workers never load the C++ extension.
                 try:
+                    import xformers  # noqa: F401
                     self._pipe.enable_xformers_memory_efficient_attention()
                     print("INFRA_VIDEO: xFormers Active.")
                 except Exception as e:
                     print(f"INFRA_VIDEO: WARNING - xFormers failed: {e}")
+                    # Rung-down: PyTorch fused SDPA (FlashAttention-2 / memory-efficient kernels).
+                    self._pipe.unet.set_attn_processor(AttnProcessor2_0())
+                    print("INFRA_VIDEO: SDPA attention fallback active.")
 
                 # 2. Channels Last Memory Format (Speed Boost)
                 # Applying this to the 3D UNet is tricky but beneficial.
@@ -122,6 +138,68 @@ class StableVideoAnimateDiffGenerator(VideoGeneratorPort):
             print(f"INFRA_VIDEO_BOOT_FAILURE: {str(e)}")
             raise e
 
+    def _load_pretrained(self, component_cls, repo_id: str, **kwargs):
+        """
+        Loads a Hugging Face component, preferring the fp16 weight variant on CUDA.
+        Falls back to the full-precision checkpoint when the repo publishes no variant.
+        Modules are built on the meta device and the mmapped safetensors assigned in place.
+        """
+        kwargs.setdefault("low_cpu_mem_usage", True)
+        if self._variant:
+            try:
+                return component_cls.from_pretrained(repo_id, variant=self._variant, **kwargs)
+            except (OSError, ValueError):
+                print(f"INFRA_VIDEO: No {self._variant} variant for [{repo_id}]. Loading full weights.")
+        return component_cls.from_pretrained(repo_id, **kwargs)
+
+    def _memoize_scheduler_timesteps(self, default_steps: int = 25) -> None:
+        """
+        Caches the DDIM timestep arrays per (steps, device). They are invariant for the
+        fixed linear beta schedule, so repeated tasks skip the per-call reconstruction.
+        """
+        scheduler = self._pipe.scheduler
+        compute_timesteps = scheduler.set_timesteps
+        cache = {}
+
+        def set_timesteps(num_inference_steps, device=None, **kwargs):
+            if kwargs:
+                return compute_timesteps(num_inference_steps, device=device, **kwargs)
+            key = (num_inference_steps, str(device))
+            if key not in cache:
+                compute_timesteps(num_inference_steps, device=device)
+                cache[key] = scheduler.timesteps
+            else:
+                scheduler.num_inference_steps = num_inference_steps
+                scheduler.timesteps = cache[key]
+
+        scheduler.set_timesteps = set_timesteps
+        set_timesteps(default_steps, device=self._device)
+
+    def _decode_latents_on_cpu(self, latents: torch.Tensor, chunk_size: int = 4) -> np.ndarray:
+        """
+        Decodes [B, C, T, H, W] video latents with a dedicated fp32 VAE on the CPU.
+        Roughly 2x slower per frame than GPU decoding on Pascal, but it never OOMs.
+        """
+        if self._cpu_vae is None:
+            print("INFRA_VIDEO: Loading fp32 CPU decoder for VRAM-safe VAE decoding...")
+            self._cpu_vae = AutoencoderKL.from_pretrained(
+                "stabilityai/sd-vae-ft-mse",
+                torch_dtype=torch.float32,
+                local_files_only=self._offline,
+                use_safetensors=True
+            ).to("cpu")
+
+        latents = latents.float().cpu() / self._cpu_vae.config.scaling_factor
+        batch, channels, num_frames, height, width = latents.shape
+        latents = latents.permute(0, 2, 1, 3, 4).reshape(batch * num_frames, channels, height, width)
+
+        decoded = [
+            self._cpu_vae.decode(latents[i:i + chunk_size]).sample
+            for i in range(0, latents.shape[0], chunk_size)
+        ]
+        video = (torch.cat(decoded)[:num_frames] / 2 + 0.5).clamp(0, 1)
+        return video.permute(0, 2, 3, 1).numpy()
+
     def animate_image(
         self, 
         source_image: Image.Image, 
@@ -135,54 +213,82 @@ class StableVideoAnimateDiffGenerator(VideoGeneratorPort):
         
         start_time = time.time()
         
-        # 1. Manifold Pre-processing (Enforced 64-px grid)
-        width, height = source_image.size
-        target_w = (width // 64) * 64
-        target_h = (height // 64) * 64
-        input_image = source_image.convert("RGB").resize((target_w, target_h), Image.Resampling.LANCZOS)
-
-        # 2. Prompt Synthesis
+        # 1. Prompt Synthesis
+        # NOTE: The text-to-video pipeline is not image-conditioned, so the source
+        # manifold is not resized here (the identity is carried by the Subject DNA).
         dna_base = subject_metadata.get("prompt_base", "")
         final_prompt = f"photorealistic cinematic video, {dna_base}, {motion_prompt}, high quality, 8k, detailed skin texture, natural light"
         negative_prompt = subject_metadata.get("negative_prompt", "anime, plastic, flicker, low quality, cartoon, drawing")
 
-        # 3. Temporal Neural Inference
+        # 2. Temporal Neural Inference
+        total_steps = int(hyper_params.get("steps", 25))
         if progress_callback: 
-            progress_callback(0, duration_frames, "status_generating")
+            progress_callback(0, total_steps, "status_generating")
 
-        with torch.inference_mode():
+        # Reports real denoising progress (the diffusion loop dominates wall time).
+        def internal_callback(pipe, i, t, callback_kwargs):
+            if progress_callback:
+                progress_callback(i + 1, total_steps, "status_generating")
+            return callback_kwargs
+
+        # Opt-in CPU decoding ("vae_decode_device": "cpu") for cards that OOM during VAE decode.
+        decode_on_cpu = self._device == "cuda" and hyper_params.get("vae_decode_device", "auto") == "cpu"
+
+        # Autocast keeps scheduler and motion-module ops in fp16 on CUDA.
+        with torch.inference_mode(), torch.autocast("cuda", dtype=torch.float16, enabled=self._device == "cuda"):
             output = self._pipe(
                 prompt=final_prompt,
                 negative_prompt=negative_prompt,
                 num_frames=duration_frames,
                 guidance_scale=float(hyper_params.get("cfg_scale", 7.5)),
-                num_inference_steps=int(hyper_params.get("steps", 25)),
+                num_inference_steps=total_steps,
+                # CPU generator: a seed reproduces the same clip on CPU and GPU workers. DDIM (eta=0)
+                # draws the initial latents only once, so a device-local generator saves almost nothing.
                 generator=torch.Generator("cpu").manual_seed(int(hyper_params.get("seed", 42))),
                 decode_chunk_size=1, # Decode one frame at a time to save VRAM
+                output_type="latent" if decode_on_cpu else "np",
+                callback_on_step_end=internal_callback
             )
-            frames = output.frames[0]
-
-        # 4. Container Encoding
-        video_buffer = io.BytesIO()
-        writer = imageio.get_writer(
-            video_buffer, 
-            format='MP4', 
-            fps=fps, 
-            codec='libx264', 
-            quality=8
-        )
-        
-        for i, frame in enumerate(frames):
-            writer.append_data(np.array(frame))
-            if progress_callback:
-                progress_callback(i + 1, duration_frames, "status_encoding")
-        writer.close()
 
-        # 5. Report Generation
-        video_b64 = base64.b64encode(video_buffer.getvalue()).decode('utf-8')
-        
+        with torch.inference_mode():
+            frames = self._decode_latents_on_cpu(output.frames) if decode_on_cpu else output.frames[0]
+        # Single contiguous [T, H, W, 3] uint8 tensor for the encoder.
+        frames = (np.clip(frames, 0.0, 1.0) * 255).round().astype(np.uint8)
+
+        # 3. Container Encoding
+        # Raw RGB frames are piped straight into FFmpeg's stdin, skipping imageio's
+        # per-frame probing; 'veryfast' halves x264 CPU time at preview-grade quality.
+        # Encoding continues the denoising scale at its last step: a 0% report would
+        # drop the bar back to the warmup label right after denoising hit 100%.
+        if progress_callback:
+            progress_callback(total_steps, total_steps, "status_encoding")
+
+        frame_h, frame_w = frames.shape[1:3]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            video_path = os.path.join(tmp_dir, "clip.mp4")
+            writer = imageio_ffmpeg.write_frames(
+                video_path,
+                (frame_w, frame_h),
+                fps=fps,
+                codec='libx264',
+                quality=8,
+                macro_block_size=1,
+                pix_fmt_in='rgb24',
+                pix_fmt_out='yuv420p',
+                output_params=['-preset', 'veryfast', '-threads', '0']
+            )
+            writer.send(None)  # Spawns the FFmpeg subprocess
+            for frame in frames:
+                writer.send(frame.tobytes())
+            writer.close()
+
+            with open(video_path, 'rb') as f:
+                video_bytes = f.read()
+
+        # 4. Report Generation
+        # Raw container bytes: the API serves them as-is from its media endpoint.
         return AnimationReport(
-            video_b64=video_b64,
+            video_bytes=video_bytes,
             inference_time=round(time.time() - start_time, 2),
             total_frames=duration_frames,
             fps=fps
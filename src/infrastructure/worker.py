@@ -13,19 +13,38 @@
 # author: Enrique González Gutiérrez <enrique.gonzalez.gutierrez@gmail.com>
 
 import os
+
+# Allocator policy must be set before torch initializes CUDA. Expandable segments
+# let the STATIC <-> TEMPORAL engine swaps reuse VRAM without fragmenting it, and
+# the GC threshold reclaims cached blocks automatically (no empty_cache() on switch).
+os.environ.setdefault(
+    "PYTORCH_CUDA_ALLOC_CONF",
+    "expandable_segments:True,max_split_size_mb:256,garbage_collection_threshold:0.8"
+)
+# JIT-compiled PTX (e.g. xFormers kernels without SASS for the local arch) is cached on
+# the persistent model volume, so container restarts skip recompilation.
+os.environ.setdefault("CUDA_CACHE_PATH", os.path.join(os.getenv("HF_HOME", "/app/model_cache"), "cuda_cache"))
+os.environ.setdefault("CUDA_CACHE_MAXSIZE", str(2 * 1024**3))
+
 import io
-import base64
-import torch
+import json
+import hashlib
+import msgpack
 import time
 import gc 
+import weakref
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from celery import Celery
+from celery.signals import worker_process_init, worker_ready
 from PIL import Image
 
 # Domain & Application Layer Imports
+# NOTE: torch and the neural adapters are imported inside the functions that need
+# them. The API imports this module for the task signatures and must never pay
+# for (or initialize) CUDA; workers pay it once, on their first task.
 from src.application.use_cases import TransformCharacterUseCase, AnimateCharacterUseCase
-from src.infrastructure.sd_generator import StableDiffusionGenerator
-from src.infrastructure.video_generator import StableVideoAnimateDiffGenerator
-from src.infrastructure.evaluator import ComputerVisionEvaluator
 from src.infrastructure.analyzer import HeuristicImageAnalyzer
 
 # --- CELERY INFRASTRUCTURE CONFIGURATION ---
@@ -34,94 +53,272 @@ RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://z-realism-broker:63
 
 celery_app = Celery("z_realism_worker", broker=BROKER_URL, backend=RESULT_BACKEND)
 
+# msgpack carries raw image/video bytes; JSON would force a base64 round-trip
+# (+33% payload through Redis) on both the request and the result.
 celery_app.conf.update(
+    task_serializer='msgpack',
+    result_serializer='msgpack',
+    accept_content=['msgpack'],
     task_track_started=True,
     worker_prefetch_multiplier=1, 
     task_acks_late=True,
+    # No task declares a rate limit; skip the per-task token-bucket bookkeeping.
+    worker_disable_rate_limits=True,
+    # A failed task (e.g. CUDA OOM) is acknowledged, so it never loops back into the queue...
+    task_acks_on_failure_or_timeout=True,
+    # ...but a task whose worker process died mid-inference is redelivered.
+    task_reject_on_worker_lost=True,
+    # One queue per engine, so a dedicated worker per GPU never context-switches models.
+    task_routes={
+        "transform_character_task": {"queue": "static"},
+        "animate_character_task": {"queue": "temporal"},
+    },
     broker_connection_retry_on_startup=True
 )
 
+# PROGRESS states are rewritten at most this often, plus on phase changes and completion.
+PROGRESS_MIN_INTERVAL_S = 0.25
+
+def progress_gate():
+    """
+    Returns a per-task predicate deciding whether a PROGRESS write goes to the backend.
+    Closure state is safe: one task per worker process with prefetch=1.
+    """
+    last_status, last_emit = None, 0.0
+
+    def should_emit(current, total, status_msg):
+        nonlocal last_status, last_emit
+        now = time.monotonic()
+        if current >= total or status_msg != last_status or now - last_emit > PROGRESS_MIN_INTERVAL_S:
+            last_status, last_emit = status_msg, now
+            return True
+        return False
+
+    return should_emit
+
+# hyper_params["output_format"] -> (PIL format, save options, MIME).
+# Lossless WebP at method=0 encodes several times faster than PNG's zlib pass;
+# lossy WebP trades exactness for ~3-5x smaller payloads on photoreal output.
+RESULT_ENCODINGS = {
+    "webp": ("WEBP", {"lossless": True, "quality": 90, "method": 0}, "image/webp"),
+    "webp_lossy": ("WEBP", {"quality": 92, "method": 4}, "image/webp"),
+    "png": ("PNG", {}, "image/png"),
+}
+
+# Finished static syntheses are content-addressed in Redis; identical resubmissions skip the U-Net.
+RESULT_CACHE_TTL_S = int(os.getenv("RESULT_CACHE_TTL_S", 24 * 3600))
+
+def result_cache_key(image_bytes: bytes, *params, namespace: str = "result") -> str:
+    """
+    Content address of a request: source bytes plus every parameter.
+    """
+    # Streamed into the hasher: the upload is read once and never copied.
+    # BLAKE2b (stdlib) outpaces SHA-256 on 64-bit hosts; 128 bits is ample for cache keys.
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(memoryview(image_bytes))
+    hasher.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+    return f"{namespace}:{hasher.hexdigest()}"
+
 # --- GLOBAL STATE FOR RESOURCE ORCHESTRATION ---
-_current_model_instance = None
-_current_model_type = None  # ENUM: 'STATIC' | 'TEMPORAL'
+# Both engines run with CPU offload, so a cached engine mostly costs host RAM.
+# Keeping both resident turns a STATIC <-> TEMPORAL switch into a PCIe copy
+# instead of a full disk reload. Set to 1 on hosts short on system memory.
+MAX_CACHED_ENGINES = int(os.getenv("MAX_CACHED_ENGINES", 2))
+
+_model_cache = OrderedDict()  # KEY: 'STATIC' | 'TEMPORAL' -> use case, LRU order
+_RESOURCE_LOCK = threading.Lock()  # Guards engine construction/eviction
+
+# Heuristic-only consumers (the temporal analyzer) never need more than this.
+TEMPORAL_SOURCE_ANCHOR = 512
+
+# Single background thread: the upload decode runs while the task fetches or loads its engine.
+_DECODE_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="z_decode")
+
+def decode_source_image(image_bytes: bytes, resolution_anchor: int) -> Image.Image:
+    """
+    Decodes the uploaded manifold, letting libjpeg downscale by powers of two
+    during decode so multi-megapixel uploads never materialize at full size.
+    """
+    img = Image.open(io.BytesIO(image_bytes))
+    # No-op for non-JPEG sources; JPEG keeps at least the requested size.
+    img.draft("RGB", (resolution_anchor, resolution_anchor))
+    img.load()
+    return img
 
-def manage_hardware_resources(target_type: str):
+def manage_hardware_resources(target_type: str, warmup: bool = False):
     """
     Hybrid Resource Manager.
     Dynamically adapts the worker's memory profile based on the incoming neural task.
+    warmup=True (boot prewarm only) also runs a kernel warmup pass on a new STATIC engine.
     """
-    global _current_model_instance, _current_model_type
+    import torch
 
-    if _current_model_instance is not None and _current_model_type == target_type:
+    # Fast path (unlocked): a hit never waits behind another thread's 20s engine load.
+    use_case = _model_cache.get(target_type)
+    if use_case is not None:
         print(f"WORKER_SYS: Manifold Hit. Reusing {target_type} engine.")
-        return _current_model_instance
-
-    if _current_model_instance is not None:
-        print(f"WORKER_SYS: Context Switch ({_current_model_type} -> {target_type}).")
-        del _current_model_instance
-        _current_model_instance = None
-        gc.collect()
-        if torch.cuda.is_available():
-            torch.cuda.empty_cache()
-            torch.cuda.ipc_collect()
-            print(f"WORKER_SYS: CUDA VRAM Purged.")
-
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    print(f"WORKER_SYS: Deploying {target_type} engine on [{device.upper()}]...")
-
-    if target_type == 'STATIC':
-        evaluator = ComputerVisionEvaluator()
-        generator = StableDiffusionGenerator(device=device)
-        _current_model_instance = TransformCharacterUseCase(generator, evaluator)
-        _current_model_type = 'STATIC'
+        try:
+            _model_cache.move_to_end(target_type)
+        except KeyError:
+            pass  # Evicted concurrently; the caller still holds a live reference.
+        return use_case
+
+    # Slow path: under threads/gevent pools, concurrent misses would each build an
+    # engine and double the VRAM footprint. The re-check makes the losers reuse it.
+    with _RESOURCE_LOCK:
+        if target_type in _model_cache:
+            return _model_cache[target_type]
+
+        if torch.cuda.is_available() and _model_cache:
+            # Event fence: let in-flight kernels finish before weights move or are released.
+            torch.cuda.synchronize()
+
+        purge = None
+        while len(_model_cache) >= max(MAX_CACHED_ENGINES, 1):
+            evicted_type, evicted = _model_cache.popitem(last=False)
+            print(f"WORKER_SYS: Context Switch ({evicted_type} -> {target_type}). Evicting {evicted_type} engine.")
+            weakref.finalize(evicted, print, f"WORKER_SYS: {evicted_type} engine released.")
+            del evicted
+            # Pipelines hold reference cycles (hooks, schedulers); one full pass collects them.
+            # It runs in the background while the next engine's weights load from disk, and is
+            # joined before the engine is published. Freed VRAM is reclaimed by garbage_collection_threshold.
+            if purge is None:
+                purge = threading.Thread(target=gc.collect, args=(2,), daemon=True)
+                purge.start()
+
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        print(f"WORKER_SYS: Deploying {target_type} engine on [{device.upper()}]...")
+
+        if target_type == 'STATIC':
+            from src.infrastructure.sd_generator import StableDiffusionGenerator
+            from src.infrastructure.evaluator import ComputerVisionEvaluator
+            evaluator = ComputerVisionEvaluator()
+            generator = StableDiffusionGenerator(device=device)
+            if purge is not None:
+                purge.join()
+            if warmup:
+                generator.warmup(resolution_anchor=PREWARM_RESOLUTION_ANCHOR)
+            _model_cache[target_type] = TransformCharacterUseCase(generator, evaluator)
         
-    elif target_type == 'TEMPORAL':
-        video_generator = StableVideoAnimateDiffGenerator(device=device)
-        analyzer = HeuristicImageAnalyzer()
-        _current_model_instance = AnimateCharacterUseCase(video_generator, analyzer)
-        _current_model_type = 'TEMPORAL'
+        elif target_type == 'TEMPORAL':
+            from src.infrastructure.video_generator import StableVideoAnimateDiffGenerator
+            video_generator = StableVideoAnimateDiffGenerator(device=device)
+            if purge is not None:
+                purge.join()
+            analyzer = HeuristicImageAnalyzer()
+            _model_cache[target_type] = AnimateCharacterUseCase(video_generator, analyzer)
+
+        return _model_cache[target_type]
+
+# Opt-in boot prewarm (Z_REALISM_PREWARM=1): CUDA context + STATIC engine are built, and its
+# kernels warmed, before the first task arrives. Off by default to keep CPU-only and CI workers cheap.
+PREWARM_ON_BOOT = os.getenv("Z_REALISM_PREWARM", "0") == "1"
+# Warmup shape: the image lab's default resolution anchor, so the first real call reuses its kernels.
+PREWARM_RESOLUTION_ANCHOR = int(os.getenv("Z_REALISM_PREWARM_ANCHOR", 640))
+
+def prewarm_worker():
+    import torch
+
+    if torch.cuda.is_available():
+        torch.cuda.init()
+    manage_hardware_resources('STATIC', warmup=True)
+    print("WORKER_SYS: Prewarm complete. STATIC engine resident.")
+
+@worker_process_init.connect
+def _prewarm_pool_process(**kwargs):
+    # Prefork children: tasks execute here, not in the parent.
+    if PREWARM_ON_BOOT:
+        prewarm_worker()
+
+@worker_ready.connect
+def _prewarm_solo_worker(sender=None, **kwargs):
+    # The solo pool runs tasks in the main process, which never receives worker_process_init.
+    pool = getattr(sender, "pool", None)
+    if PREWARM_ON_BOOT and pool is not None and type(pool).__module__.endswith(".solo"):
+        prewarm_worker()
+
+def get_task_stream(task):
+    """
+    Lazily attaches a dedicated CUDA stream to the (per-process) task instance.
+    Returns None on CPU workers, which makes torch.cuda.stream() a no-op.
+    """
+    import torch
+
+    if not torch.cuda.is_available():
+        return None
+    if getattr(task, "_stream", None) is None:
+        task._stream = torch.cuda.Stream()
+    return task._stream
+
+def report_peak_memory():
+    """
+    Logs the task's peak VRAM footprint and resets the counter for the next task.
+    """
+    import torch
 
-    return _current_model_instance
+    if torch.cuda.is_available():
+        peak_gb = torch.cuda.max_memory_allocated() / 1024**3
+        print(f"WORKER_SYS: Peak VRAM allocated during task: {peak_gb:.2f} GB.")
+        torch.cuda.reset_peak_memory_stats()
 
 # --- ASYNCHRONOUS TASK DEFINITIONS ---
 
 @celery_app.task(name="transform_character_task", bind=True)
-def transform_character_task(self, image_b64, character_name, feature_prompt, resolution_anchor, hyper_params):
+def transform_character_task(self, image_bytes, character_name, feature_prompt, resolution_anchor, hyper_params):
     """
     Orchestrates the Image-to-Image static transformation pipeline.
     """
+    import torch
+
     total_steps = int(hyper_params.get("steps", 30))
 
-    def on_progress(current, total=total_steps, preview_b64=None):
+    should_emit = progress_gate()
+
+    def on_progress(current, total=total_steps, status_msg="status_processing"):
         pct = min(max(int((current / total) * 100), 0), 100)
-        # Using i18n key: status_processing
-        self.update_state(state='PROGRESS', meta={
-            'percent': pct, 
-            'preview_b64': preview_b64, 
-            'status_text': 'status_processing'
-        })
+        if should_emit(current, total, status_msg):
+            # Using i18n keys: status_processing | status_finalizing
+            self.update_state(state='PROGRESS', meta={'percent': pct, 'status_text': status_msg})
 
     try:
         # Using i18n key: status_warmup
         self.update_state(state='PROGRESS', meta={'percent': 0, 'status_text': 'status_warmup'})
-        source_pil = Image.open(io.BytesIO(base64.b64decode(image_b64)))
+
+        cache_key = result_cache_key(image_bytes, character_name, feature_prompt, resolution_anchor, hyper_params)
+        cached = celery_app.backend.client.get(cache_key)
+        if cached:
+            print(f"WORKER_SYS: Result cache hit ({cache_key}). Skipping synthesis.")
+            return msgpack.unpackb(cached)
+
+        # The decode (PIL releases the GIL) overlaps with the engine fetch/load.
+        decode_future = _DECODE_POOL.submit(decode_source_image, image_bytes, int(resolution_anchor))
         use_case = manage_hardware_resources('STATIC')
-        result_pil, report = use_case.execute(
-            image_file=source_pil, 
-            character_name=character_name,
-            feature_prompt=feature_prompt,
-            resolution_anchor=resolution_anchor,
-            hyper_params=hyper_params,
-            callback=on_progress
-        )
+        source_pil = decode_future.result()
+        # No autograd bookkeeping anywhere in the task; allocator pools scoped to the task stream.
+        with torch.inference_mode(), torch.cuda.stream(get_task_stream(self)):
+            result_pil, report = use_case.execute(
+                image_file=source_pil, 
+                character_name=character_name,
+                feature_prompt=feature_prompt,
+                resolution_anchor=resolution_anchor,
+                hyper_params=hyper_params,
+                callback=on_progress
+            )
+        # The decoded source is no longer needed; release it before the encode tail.
+        del source_pil
         # Using i18n key: status_finalizing
         self.update_state(state='PROGRESS', meta={'percent': 100, 'status_text': 'status_finalizing'})
-        time.sleep(0.5) 
         buffered = io.BytesIO()
-        result_pil.save(buffered, format="PNG")
+        image_format, save_options, image_mime = RESULT_ENCODINGS.get(
+            hyper_params.get("output_format", "webp"), RESULT_ENCODINGS["webp"]
+        )
+        result_pil.save(buffered, format=image_format, **save_options)
+        result_image_bytes = buffered.getvalue()
+        del buffered, result_pil
         
-        return {
-            "result_image_b64": base64.b64encode(buffered.getvalue()).decode('utf-8'),
+        result = {
+            "result_image_bytes": result_image_bytes,
+            "result_image_mime": image_mime,
             "metrics": {
                 "structural_similarity": report.structural_similarity,
                 "identity_preservation": report.identity_preservation,
@@ -130,40 +327,50 @@ def transform_character_task(self, image_b64, character_name, feature_prompt, re
                 "full_prompt": report.full_prompt
             }
         }
+        celery_app.backend.client.setex(cache_key, RESULT_CACHE_TTL_S, msgpack.packb(result))
+        return result
     except Exception as e:
         print(f"WORKER_ERROR: Static transformation failed. Details: {str(e)}")
         raise e
+    finally:
+        report_peak_memory()
 
 @celery_app.task(name="animate_character_task", bind=True)
-def animate_character_task(self, image_b64, character_name, video_params):
+def animate_character_task(self, image_bytes, character_name, video_params):
     """
     Orchestrates the Temporal (Video) synthesis pipeline.
     """
+    import torch
     
+    should_emit = progress_gate()
+
     def on_progress(current, total, status_msg="status_processing"):
         pct = min(max(int((current / total) * 100), 0), 100)
-        self.update_state(state='PROGRESS', meta={'percent': pct, 'status_text': status_msg})
+        if should_emit(current, total, status_msg):
+            self.update_state(state='PROGRESS', meta={'percent': pct, 'status_text': status_msg})
 
     try:
         # Using i18n key: status_warmup
         self.update_state(state='PROGRESS', meta={'percent': 0, 'status_text': 'status_warmup'})
         
-        source_pil = Image.open(io.BytesIO(base64.b64decode(image_b64)))
+        decode_future = _DECODE_POOL.submit(decode_source_image, image_bytes, TEMPORAL_SOURCE_ANCHOR)
         use_case = manage_hardware_resources('TEMPORAL')
+        source_pil = decode_future.result()
         
-        report = use_case.execute(
-            image_file=source_pil,
-            character_name=character_name,
-            video_params=video_params,
-            callback=on_progress 
-        )
+        with torch.inference_mode(), torch.cuda.stream(get_task_stream(self)):
+            report = use_case.execute(
+                image_file=source_pil,
+                character_name=character_name,
+                video_params=video_params,
+                callback=on_progress 
+            )
+        del source_pil
 
         # Using i18n key: status_finalizing
         self.update_state(state='PROGRESS', meta={'percent': 100, 'status_text': 'status_finalizing'})
-        time.sleep(0.5)
 
         return {
-            "video_b64": report.video_b64,
+            "video_bytes": report.video_bytes,
             "metrics": {
                 "inference_time": report.inference_time,
                 "total_frames": report.total_frames,
@@ -172,4 +379,6 @@ def animate_character_task(self, image_b64, character_name, video_params):
         }
     except Exception as e:
         print(f"WORKER_ERROR: Temporal synthesis failed. Details: {str(e)}")
-        raise e
\ No newline at end of file
+        raise e
+    finally:
+        report_peak_memory()
\ No newline at end of file
@@ -38,11 +38,31 @@ PORT = int(os.getenv("APP_PORT", 8000))
 # - Disabled: For immutable process execution in production.
 RELOAD = os.getenv("ENVIRONMENT", "production").lower() == "development"
 
+# WORKERS: ASGI worker processes (production only; the reloader runs a single one).
+# The hardware mutex lives in Redis and is taken atomically (SET NX), so any number
+# of API workers stays consistent.
+WORKERS = 1 if RELOAD else int(os.getenv("APP_WORKERS", 2))
+
+# LOAD SHEDDING: cap concurrent connections (excess gets 503 instead of queueing
+# behind uploads), bound the listen backlog, and let in-flight requests drain on stop.
+LIMIT_CONCURRENCY = int(os.getenv("APP_MAX_CONCURRENCY", 64))
+BACKLOG = int(os.getenv("APP_BACKLOG", 256))
+SHUTDOWN_TIMEOUT = int(os.getenv("APP_SHUTDOWN_TIMEOUT", 30))
+
+# EVENT LOOP: uvloop + httptools (libuv / C HTTP parser) when installed,
+# Uvicorn's pure-asyncio defaults otherwise (e.g. Windows development).
+try:
+    import uvloop  # noqa: F401
+    import httptools  # noqa: F401
+    LOOP, HTTP = "uvloop", "httptools"
+except ImportError:
+    LOOP, HTTP = "auto", "auto"
+
 if __name__ == "__main__":
     """
     Main Execution Block.
     
-    Triggered when the Docker entrypoint executes 'python src/main.py'.
+    Triggered when the Docker entrypoint executes 'python -m src.main'.
     Initializes the Uvicorn engine with a standard ASGI configuration.
     """
     
@@ -50,6 +70,7 @@ if __name__ == "__main__":
     print(f"SYSTEM_BOOT: Z-Realism AI Service v21.0 initialized.")
     print(f"NETWORK_BIND: Binding to interface [{HOST}:{PORT}]")
     print(f"EXECUTION_MODE: {'DEBUG/RELOAD_ACTIVE' if RELOAD else 'STABLE/IMMUTABLE_MODE'}")
+    print(f"SERVER_RUNTIME: loop={LOOP} http={HTTP} workers={WORKERS}")
     
     # Launch the ASGI Server
     # Note: We use the string path "src.main:app" to allow Uvicorn's
@@ -59,11 +80,19 @@ if __name__ == "__main__":
         host=HOST,
         port=PORT,
         reload=RELOAD,
-        log_level="info",
+        workers=WORKERS,
+        loop=LOOP,
+        http=HTTP,
+        # Per-request access lines (one per status poll) only in development.
+        log_level="info" if RELOAD else "warning",
+        access_log=RELOAD,
         
         # TIMEOUT CONFIGURATION:
         # High-fidelity synthesis results (Images/Videos) generate large 
-        # Base64 payloads. We increase the keep-alive timeout to prevent 
+        # binary payloads. We increase the keep-alive timeout to prevent 
         # early termination during the transmission of these manifolds.
-        timeout_keep_alive=65
+        timeout_keep_alive=65,
+        limit_concurrency=LIMIT_CONCURRENCY,
+        backlog=BACKLOG,
+        timeout_graceful_shutdown=SHUTDOWN_TIMEOUT
     )
\ No newline at end of file
@@ -48,11 +48,16 @@ function joinUrl(base, path) {
     return `${cleanBase}${cleanPath}`;
 }
 
+// Endpoint prefixes resolved once; the polling loop only appends the task id.
+const STATUS_URL_PREFIX = joinUrl(API_BASE_URL, '/status/');
+const RESULT_URL_PREFIX = joinUrl(API_BASE_URL, '/result/');
+
 /**
  * Sends a multipart/form-data payload to the neural gateway.
  * Localized errors are triggered if the server is unreachable or returns a fault.
+ * onErrorKey, if given, receives the backend error key before the alert.
  */
-async function postToGateway(endpoint, formData) {
+async function postToGateway(endpoint, formData, onErrorKey) {
     try {
         const targetUrl = joinUrl(API_BASE_URL, endpoint);
         const response = await fetch(targetUrl, {
@@ -69,6 +74,7 @@ async function postToGateway(endpoint, formData) {
             }
 
             const errorData = await response.json();
+            if (onErrorKey) onErrorKey(errorData.detail);
             // Resolve backend error key through the i18n engine
             const translatedMessage = i18n.translate(errorData.detail || 'error_inference_failed');
             throw new Error(translatedMessage);
@@ -85,63 +91,192 @@ async function postToGateway(endpoint, formData) {
 }
 
 /**
- * Polls the system status for a specific asynchronous neural task.
+ * UPLOAD HANDLES
+ * The gateway can park a source file for a few minutes (/upload, /analyze) so
+ * repeated jobs on the same artwork send only its id instead of the bytes.
+ */
+const UPLOAD_EXPIRY_MARGIN_MS = 30000; // never use a handle right as it expires
+
+const fileIdentity = (file) => `${file.name}|${file.size}|${file.lastModified}`;
+
+function makeUploadHandle(file, response) {
+    // Oversized artwork is not parked (no id). The handle still records that
+    // outcome, so later jobs send the file inline without re-posting it to /upload.
+    const parked = Boolean(response.upload_id);
+    return {
+        fileKey: fileIdentity(file),
+        id: parked ? response.upload_id : null,
+        expiresAt: parked ? Date.now() + response.upload_ttl * 1000 - UPLOAD_EXPIRY_MARGIN_MS : Infinity
+    };
+}
+
+function isUploadHandleValid(handle, file) {
+    return Boolean(handle && handle.fileKey === fileIdentity(file) && Date.now() < handle.expiresAt);
+}
+
+async function registerUpload(file) {
+    const formData = new FormData();
+    formData.append('file', file);
+    const data = await postToGateway('/upload', formData);
+    return data ? makeUploadHandle(file, data) : null;
+}
+
+// Job source: the parked id when one is valid, the file itself otherwise.
+function appendUploadSource(formData, handle, file) {
+    if (isUploadHandleValid(handle, file) && handle.id) {
+        formData.append('upload_id', handle.id);
+    } else {
+        formData.append('file', file);
+    }
+}
+
+// A parked copy the server no longer has (TTL, flush) must not be sent again.
+const dropExpiredUpload = (state) => (errorKey) => {
+    if (errorKey === 'error_upload_expired') state.upload = null;
+};
+
+/**
+ * Fetches the raw media of a completed task and exposes it as a Blob URL.
+ * The body arrives as binary, so nothing is base64-decoded or JSON-parsed.
+ */
+async function fetchResultMedia(taskId) {
+    try {
+        const response = await fetch(`${RESULT_URL_PREFIX}${taskId}/media`, { headers: SHARED_HEADERS });
+        if (!response.ok) return null;
+        return URL.createObjectURL(await response.blob());
+    } catch (error) {
+        console.error("MEDIA_FETCH_FAILURE:", error);
+        return null;
+    }
+}
+
+/**
+ * Consumes the NDJSON status stream of a task, handing each snapshot to
+ * onSnapshot. Resolves true once onSnapshot reports a terminal state and
+ * false if the stream is unavailable or drops, so callers can fall back.
+ */
+async function consumeStatusStream(taskId, onSnapshot) {
+    try {
+        const response = await fetch(`${STATUS_URL_PREFIX}${taskId}/stream`, { headers: SHARED_HEADERS });
+        if (!response.ok || !response.body) return false;
+
+        const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) return false;
+            buffer += value;
+
+            let newline;
+            while ((newline = buffer.indexOf('\n')) >= 0) {
+                const line = buffer.slice(0, newline);
+                buffer = buffer.slice(newline + 1);
+                if (line && await onSnapshot(JSON.parse(line))) return true;
+            }
+        }
+    } catch (error) {
+        console.warn("STATUS_STREAM_FALLBACK: Reverting to polling.");
+        return false;
+    }
+}
+
+/**
+ * Polling cadence: start fast, back off geometrically while the task is idle,
+ * and snap back to the fast rate whenever the progress percentage advances.
+ */
+const POLL_INITIAL_DELAY_MS = 250;
+const POLL_BACKOFF_FACTOR = 1.5;
+const POLL_MAX_DELAY_MS = 3000;
+// Random extra delay so tabs that started together do not poll in lockstep.
+const POLL_JITTER_MS = 100;
+
+/**
+ * Tracks the system status for a specific asynchronous neural task, via the
+ * status stream with backoff polling as fallback.
  * Updates the UI with localized progress states and ETA.
  */
 async function pollNeuralTask(taskId, onProgress, onComplete) {
     if (!taskId) return;
 
     let inferenceStartTime = null;
+    let pollDelay = POLL_INITIAL_DELAY_MS;
+    let lastPercent = -1;
+    // Terminal marker: completion is delivered exactly once, even if the stream
+    // drops mid-completion and the polling fallback sees the same final state.
+    let finished = false;
 
-    const pollingInterval = setInterval(async () => {
-        try {
-            const statusUrl = joinUrl(API_BASE_URL, `/status/${taskId}`);
-            const response = await fetch(statusUrl, { headers: SHARED_HEADERS });
-            const data = await response.json();
-
-            if (data.status === 'PROGRESS') {
-                const rawProgress = data.progress;
-                let percent = rawProgress.percent || 0;
-                // Translate the status key received from the worker
-                let statusText = i18n.translate(rawProgress.status_text);
-                let etaLabel = i18n.translate('status_calculating');
-
-                if (percent === 0) {
-                    statusText = i18n.translate('status_warmup');
-                    percent = 2; // UI trick to show activity
-                } else {
-                    if (!inferenceStartTime) inferenceStartTime = Date.now();
-                    const elapsedSeconds = (Date.now() - inferenceStartTime) / 1000;
-                    const estimatedTotalSeconds = (elapsedSeconds / percent) * 100;
-                    const remainingSeconds = Math.max(0, estimatedTotalSeconds - elapsedSeconds);
-
-                    const mins = Math.floor(remainingSeconds / 60);
-                    const secs = Math.floor(remainingSeconds % 60);
-                    etaLabel = mins > 0 ? `${mins}m ${secs}s` : `${secs}s`;
-                }
-
-                if (onProgress) {
-                    onProgress({ percent, status_text: statusText, eta: etaLabel });
-                }
-            } 
-            else if (data.status === 'SUCCESS') {
-                clearInterval(pollingInterval);
-                const resultUrl = joinUrl(API_BASE_URL, `/result/${taskId}`);
-                const resultResponse = await fetch(resultUrl, { headers: SHARED_HEADERS });
-                
-                if (resultResponse.ok) {
-                    const resultData = await resultResponse.json();
-                    if (onComplete) onComplete(resultData);
-                }
-            } 
-            else if (data.status === 'FAILURE') {
-                clearInterval(pollingInterval);
-                // Report localized inference failure
-                alert(i18n.translate('error_inference_failed'));
-                if (onComplete) onComplete(null);
+    const scheduleNextPoll = () => {
+        setTimeout(pollOnce, pollDelay + Math.random() * POLL_JITTER_MS);
+        pollDelay = Math.min(pollDelay * POLL_BACKOFF_FACTOR, POLL_MAX_DELAY_MS);
+    };
+
+    // Applies one status snapshot to the UI; returns true once the task is finished.
+    const handleStatus = async (data) => {
+        if (finished) return true;
+        if (data.status === 'PROGRESS') {
+            const rawProgress = data.progress;
+            let percent = rawProgress.percent || 0;
+            // Translate the status key received from the worker
+            let statusText = i18n.translate(rawProgress.status_text);
+            let etaLabel = i18n.translate('status_calculating');
+
+            if (percent > lastPercent) {
+                lastPercent = percent;
+                pollDelay = POLL_INITIAL_DELAY_MS;
+            }
+
+            if (percent === 0) {
+                statusText = i18n.translate('status_warmup');
+                percent = 2; // UI trick to show activity
+            } else {
+                if (!inferenceStartTime) inferenceStartTime = Date.now();
+                const elapsedSeconds = (Date.now() - inferenceStartTime) / 1000;
+                const estimatedTotalSeconds = (elapsedSeconds / percent) * 100;
+                const remainingSeconds = Math.max(0, estimatedTotalSeconds - elapsedSeconds);
+
+                const mins = Math.floor(remainingSeconds / 60);
+                const secs = Math.floor(remainingSeconds % 60);
+                etaLabel = mins > 0 ? `${mins}m ${secs}s` : `${secs}s`;
+            }
+
+            if (onProgress) {
+                onProgress({ percent, status_text: statusText, eta: etaLabel });
+            }
+        } 
+        else if (data.status === 'SUCCESS') {
+            // Result metadata rides along with the terminal snapshot.
+            let resultData = data.result;
+            if (!resultData) {
+                const resultResponse = await fetch(RESULT_URL_PREFIX + taskId, { headers: SHARED_HEADERS });
+                if (!resultResponse.ok) return true;
+                resultData = await resultResponse.json();
             }
+            if (finished) return true;
+            finished = true;
+            if (onComplete) onComplete(resultData);
+            return true;
+        } 
+        else if (data.status === 'FAILURE') {
+            finished = true;
+            // Report localized inference failure
+            alert(i18n.translate('error_inference_failed'));
+            if (onComplete) onComplete(null);
+            return true;
+        }
+        return false;
+    };
+
+    const pollOnce = async () => {
+        try {
+            const response = await fetch(STATUS_URL_PREFIX + taskId, { headers: SHARED_HEADERS });
+            if (await handleStatus(await response.json())) return;
         } catch (error) {
             console.warn("POLLING_RETRY: Connection unstable.");
         }
-    }, 1000);
+        scheduleNextPoll();
+    };
+
+    // Preferred transport: one streamed response; backoff polling takes over if it drops.
+    if (await consumeStatusStream(taskId, handleStatus)) return;
+    scheduleNextPoll();
 }
\ No newline at end of file
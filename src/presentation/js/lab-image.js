@@ -80,6 +80,10 @@ document.addEventListener('DOMContentLoaded', () => {
         selectedFile: null,
         isProcessing: false,
         lastTaskId: null,
+        sourceUrl: null,
+        resultUrl: null,
+        // Server-side handle of the last analysed artwork (see /analyze upload_id)
+        upload: null,
         // Character DNA Metadata
         detectedName: "UNKNOWN",
         detectedEssence: "NULL"
@@ -93,8 +97,12 @@ document.addEventListener('DOMContentLoaded', () => {
      * Resets the production workspace and hides telemetry.
      */
     const resetWorkspace = () => {
+        if (state.resultUrl) {
+            URL.revokeObjectURL(state.resultUrl);
+            state.resultUrl = null;
+        }
         ui.dynamicContentViewport.innerHTML = `
-            <div style="color: rgba(255,255,255,0.02); font-family: var(--font-code); font-size: 2.5rem; font-weight: 800; letter-spacing: 10px;">
+            <div class="viewport-watermark">
                 OFFLINE
             </div>
         `;
@@ -145,7 +153,10 @@ document.addEventListener('DOMContentLoaded', () => {
         if (file) {
             state.selectedFile = file;
             ui.dropZone.classList.add('has-file');
-            const url = URL.createObjectURL(file);
+            // One Blob URL per selection; release the previous one so
+            // re-selecting files does not keep old uploads alive.
+            if (state.sourceUrl) URL.revokeObjectURL(state.sourceUrl);
+            const url = state.sourceUrl = URL.createObjectURL(file);
             ui.sourcePreview.innerHTML = `
                 <span class="viewport-label" data-i18n="lab_viewport_source">${i18n.translate('lab_viewport_source')}</span>
                 <img src="${url}" alt="Source Asset">
@@ -154,16 +165,34 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     };
 
+    // Analysis is deterministic per (artwork, name): repeats are a Map lookup.
+    const ANALYSIS_CACHE_LIMIT = 64;
+    const analysisCache = new Map();
+
     // Asset Intelligence: DNA Extraction & DNA Profile Storage (e.g., Akuma)
     ui.btnAnalyze.onclick = async () => {
         if (!state.selectedFile || state.isProcessing) return;
         ui.essenceTag.innerText = "ANALYZING_ARTWORK_DNA..."; 
 
-        const formData = new FormData();
-        formData.append('file', state.selectedFile);
-        formData.append('character_name', ui.charName.value || "Unknown");
+        const file = state.selectedFile;
+        const characterName = ui.charName.value || "Unknown";
+        const cacheKey = `${fileIdentity(file)}|${characterName}`;
+
+        let data = analysisCache.get(cacheKey);
+        if (!data) {
+            const formData = new FormData();
+            formData.append('file', file);
+            formData.append('character_name', characterName);
 
-        const data = await postToGateway('/analyze', formData);
+            data = await postToGateway('/analyze', formData);
+            if (data && data.status === 'success') {
+                state.upload = makeUploadHandle(file, data);
+                if (analysisCache.size >= ANALYSIS_CACHE_LIMIT) {
+                    analysisCache.delete(analysisCache.keys().next().value);
+                }
+                analysisCache.set(cacheKey, data);
+            }
+        }
         if (data && data.status === 'success') {
             const rec = data.recommendations;
             
@@ -203,8 +232,14 @@ document.addEventListener('DOMContentLoaded', () => {
         ui.btnGenerate.disabled = true;
         ui.btnGenerate.innerText = i18n.translate('btn_fusing');
         
+        // Register the artwork once (or reuse the copy parked by /analyze);
+        // tuning runs on the same file then send only its id.
+        if (!isUploadHandleValid(state.upload, state.selectedFile)) {
+            state.upload = await registerUpload(state.selectedFile);
+        }
+
         const formData = new FormData();
-        formData.append('file', state.selectedFile);
+        appendUploadSource(formData, state.upload, state.selectedFile);
         formData.append('character_name', ui.charName.value || "Unknown");
         formData.append('feature_prompt', ui.promptInput.value);
         formData.append('strength', ui.strengthSlider.value);
@@ -217,7 +252,7 @@ document.addEventListener('DOMContentLoaded', () => {
         formData.append('steps', ui.stepsSlider.value);
         formData.append('seed', ui.seedInput.value);
 
-        const data = await postToGateway('/transform', formData);
+        const data = await postToGateway('/transform', formData, dropExpiredUpload(state));
         
         if (data && data.task_id) {
             state.lastTaskId = data.task_id;
@@ -230,7 +265,8 @@ document.addEventListener('DOMContentLoaded', () => {
                     ui.statusText.innerText = `${progress.status_text}${etaText}`;
                 }, 
                 // Completion & HUD Injection Callback
-                (result) => {
+                async (result) => {
+                    const resultUrl = result ? await fetchResultMedia(data.task_id) : null;
                     state.isProcessing = false;
                     ui.btnGenerate.disabled = false;
                     ui.btnGenerate.innerText = i18n.translate('btn_initiate');
@@ -262,15 +298,17 @@ document.addEventListener('DOMContentLoaded', () => {
                         ui.telemetryHud.classList.remove('hidden');
                     }
                     
-                    if (result && result.result_image_b64) {
+                    if (resultUrl) {
+                        const mime = result.result_image_mime || 'image/png';
+                        state.resultUrl = resultUrl;
                         ui.dynamicContentViewport.innerHTML = `
-                            <img src="data:image/png;base64,${result.result_image_b64}" alt="Production Result">
+                            <img src="${resultUrl}" alt="Production Result">
                             <button id="btn-save" class="btn btn-secondary" style="position:absolute; bottom:20px; right:20px; z-index:10;">💾 SAVE</button>
                         `;
                         document.getElementById('btn-save').onclick = () => {
                             const link = document.createElement('a');
-                            link.href = `data:image/png;base64,${result.result_image_b64}`;
-                            link.download = `z_production_${Date.now()}.png`;
+                            link.href = resultUrl;
+                            link.download = `z_production_${Date.now()}.${mime.split('/')[1]}`;
                             link.click();
                         };
                     }
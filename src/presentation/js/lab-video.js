@@ -46,7 +46,11 @@ document.addEventListener('DOMContentLoaded', () => {
     const state = {
         selectedFile: null,
         isProcessing: false,
-        lastTaskId: null
+        lastTaskId: null,
+        sourceUrl: null,
+        mediaUrl: null,
+        // Server-side handle of the selected still, reused across animations
+        upload: null
     };
 
     // =========================================================================
@@ -54,8 +58,12 @@ document.addEventListener('DOMContentLoaded', () => {
     // =========================================================================
 
     const resetWorkspace = () => {
+        if (state.mediaUrl) {
+            URL.revokeObjectURL(state.mediaUrl);
+            state.mediaUrl = null;
+        }
         ui.dynamicContentViewport.innerHTML = ` 
-            <div style="color: rgba(255,255,255,0.02); font-family: var(--font-code); font-size: 2.5rem; font-weight: 800; user-select: none; letter-spacing: 10px;">
+            <div class="viewport-watermark">
                 ${i18n.translate('status_waiting_asset')}
             </div>
         `;
@@ -86,7 +94,10 @@ document.addEventListener('DOMContentLoaded', () => {
         if (file) {
             state.selectedFile = file;
             ui.dropZone.classList.add('has-file');
-            const url = URL.createObjectURL(file);
+            // One Blob URL per selection; release the previous one so
+            // re-selecting files does not keep old uploads alive.
+            if (state.sourceUrl) URL.revokeObjectURL(state.sourceUrl);
+            const url = state.sourceUrl = URL.createObjectURL(file);
             ui.sourcePreview.innerHTML = `
                 <span class="viewport-label" data-i18n="lab_viewport_source">${i18n.translate('lab_viewport_source')}</span>
                 <img src="${url}" style="width:100%; height:100%; object-fit:contain;">
@@ -105,15 +116,20 @@ document.addEventListener('DOMContentLoaded', () => {
         ui.btnAnimate.disabled = true;
         ui.btnAnimate.innerText = i18n.translate('btn_fusing');
         
+        // Register the still once; later runs on the same file send only its id.
+        if (!isUploadHandleValid(state.upload, state.selectedFile)) {
+            state.upload = await registerUpload(state.selectedFile);
+        }
+
         const formData = new FormData();
-        formData.append('file', state.selectedFile);
+        appendUploadSource(formData, state.upload, state.selectedFile);
         formData.append('character_name', ui.charName.value || "Unknown");
         formData.append('motion_prompt', ui.motionPrompt.value);
         formData.append('duration_frames', ui.durationSlider.value);
         formData.append('fps', ui.fpsSlider.value);
         formData.append('motion_bucket', ui.bucketSlider.value);
 
-        const data = await postToGateway('/animate', formData);
+        const data = await postToGateway('/animate', formData, dropExpiredUpload(state));
         
         if (data && data.task_id) {
             state.lastTaskId = data.task_id;
@@ -125,16 +141,18 @@ document.addEventListener('DOMContentLoaded', () => {
                     const etaText = progress.eta ? ` | ${i18n.translate('status_eta')} ${progress.eta}` : '';
                     ui.statusText.innerText = `${progress.status_text}${etaText}`;
                 }, 
-                (result) => {
+                async (result) => {
+                    const mediaUrl = result ? await fetchResultMedia(data.task_id) : null;
                     state.isProcessing = false;
                     ui.btnAnimate.disabled = false;
                     ui.btnAnimate.innerText = i18n.translate('btn_initiate_motion');
                     ui.progressOverlay.classList.add('hidden');
                     
-                    if (result && result.video_b64) {
+                    if (mediaUrl) {
+                        state.mediaUrl = mediaUrl;
                         ui.dynamicContentViewport.innerHTML = `
                             <video autoplay loop muted controls style="width:100%; height:100%; object-fit:contain; border-radius:12px; z-index:5; position:relative;">
-                                <source src="data:video/mp4;base64,${result.video_b64}" type="video/mp4">
+                                <source src="${mediaUrl}" type="video/mp4">
                             </video>
                             <button id="btn-save-vid" class="btn btn-primary" style="position:absolute; bottom:20px; right:20px; z-index:10; font-size:0.75rem; padding:10px 20px;">🎬 SAVE MP4</button>
                         `;
@@ -148,7 +166,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
                         document.getElementById('btn-save-vid').onclick = () => {
                             const link = document.createElement('a');
-                            link.href = `data:video/mp4;base64,${result.video_b64}`;
+                            link.href = mediaUrl;
                             link.download = `z_animation_${Date.now()}.mp4`;
                             link.click();
                         };